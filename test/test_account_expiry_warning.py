@@ -4,11 +4,12 @@ import io
 import json
 import os
 import re
+import time
 import unittest
 from datetime import datetime, timedelta
 from unittest.mock import _patch, patch
 
-from unity_user_resources_misc import temp_env
+from unity_user_resources_misc import LoginTelemetry, temp_env
 from unity_user_resources_misc.unity_account_expiry_warning import _main
 
 """
@@ -53,9 +54,11 @@ class TestCleanupQuotas(unittest.TestCase):
         idlelock_thresh=-1,
         group_thresh=-1,
         debug=True,
+        api_delay_seconds: dict[str, float] | None = None,
     ):
         current_user_groups = current_user_groups or []
         immortal_users = immortal_users or []
+        api_delay_seconds = api_delay_seconds or {}
         all_group_names = current_user_groups + ["immortal"]
         group_members = {"immortal": MockGroup(immortal_users)}
 
@@ -63,6 +66,7 @@ class TestCleanupQuotas(unittest.TestCase):
             _, query_param = url.split("?")
             query_param_key, query_param_val = query_param.split("=")
             assert query_param_key == "uid"
+            time.sleep(api_delay_seconds.get(query_param_val, 0))
             return MockHTTPResponse(200, json.dumps(data[query_param_val]).encode())
 
         prefix = "unity_user_resources_misc.unity_account_expiry_warning"
@@ -82,12 +86,12 @@ class TestCleanupQuotas(unittest.TestCase):
         self.stdout_buffer = io.StringIO()
         self.stderr_buffer = io.StringIO()
 
-    def run_test(self, env: dict | None = None) -> None:
+    def run_test(self, env: dict | None = None, login=False) -> None:
         env = {} if env is None else env
         with temp_env(env):
             with contextlib.redirect_stdout(self.stdout_buffer):
                 with contextlib.redirect_stderr(self.stderr_buffer):
-                    _main()
+                    _main(LoginTelemetry("unity-account-expiry-warning", login=login))
 
     def assert_test_results(
         self, idlelock_warning, group_warnings: list[str], stderr_regex=r"", debug=False
@@ -207,6 +211,52 @@ class TestCleanupQuotas(unittest.TestCase):
         self.run_test()
         self.assert_test_results(idlelock_warning=False, group_warnings=[])
 
+    def test_time_budget_already_exceeded(self):
+        self.configure_test(
+            {"foo": {"idlelock_date": days_from_today(1)}},
+            current_user="foo",
+            idlelock_thresh=2,
+        )
+        self.run_test({"UNITY_LOGIN_TIME_BUDGET_SECONDS": "0"}, login=True)
+        self.assert_test_results(idlelock_warning=False, group_warnings=[])
+
+    def test_time_budget_ignored_without_login(self):
+        # a start time left over in the environment must not affect manual runs
+        self.configure_test(
+            {"foo": {"idlelock_date": days_from_today(1)}},
+            current_user="foo",
+            idlelock_thresh=2,
+        )
+        self.run_test({"UNITY_LOGIN_START_TIME": str(time.time() - 60 * 60)})
+        self.assert_test_results(idlelock_warning=True, group_warnings=[])
+
+    def test_invalid_time_budget_env(self):
+        self.configure_test(
+            {"foo": {"idlelock_date": days_from_today(1)}},
+            current_user="foo",
+            idlelock_thresh=2,
+        )
+        env = {"UNITY_LOGIN_START_TIME": "bogus", "UNITY_LOGIN_TIME_BUDGET_SECONDS": "nan"}
+        with patch("unity_user_resources_misc.syslog.syslog"):
+            self.run_test(env, login=True)
+        self.assert_test_results(idlelock_warning=True, group_warnings=[])
+
+    def test_time_budget_exceeded_by_api(self):
+        # the PI group warning is still printed, the current user's API call is abandoned
+        self.configure_test(
+            {
+                "foo": {"idlelock_date": days_from_today(1)},
+                "bar": {"disable_date": days_from_today(1)},
+            },
+            current_user="foo",
+            current_user_groups=["pi_bar"],
+            idlelock_thresh=2,
+            group_thresh=1,
+            api_delay_seconds={"foo": 2},
+        )
+        self.run_test({"UNITY_LOGIN_TIME_BUDGET_SECONDS": "0.5"}, login=True)
+        self.assert_test_results(idlelock_warning=False, group_warnings=["bar"])
+
     def _show_output(self, env: dict | None = None):
         # account warning
         self.configure_test(
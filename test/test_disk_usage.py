@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+import contextlib
+import io
+import time
+import unittest
+from unittest.mock import _patch, patch
+
+from unity_user_resources_misc import temp_env
+from unity_user_resources_misc.unity_disk_usage import main
+
+"""
+see CONTRIBUTING.md for instructions on how to run tests
+"""
+
+SKIPPED_NOTE = "some directories were skipped because the login time budget ran out"
+
+
+class MockGroup:
+    def __init__(self, name):
+        self.gr_name = name
+
+
+class TestDiskUsage(unittest.TestCase):
+    patches: list[_patch]
+    stdout_buffer: io.StringIO | None
+
+    def configure_test(
+        self,
+        group_names: list[str],
+        existing_dirs: list[str],
+        disk_usage_delay_seconds: dict[str, float] | None = None,
+    ):
+        disk_usage_delay_seconds = disk_usage_delay_seconds or {}
+
+        def disk_usage(path: str):
+            time.sleep(disk_usage_delay_seconds.get(path, 0))
+            return (1000, 10, 990)
+
+        prefix = "unity_user_resources_misc.unity_disk_usage"
+        self.patches = [
+            patch(f"{prefix}.os.path.expanduser", lambda path: "/home/foo"),
+            patch(f"{prefix}.os.getgroups", lambda: range(len(group_names))),
+            patch(f"{prefix}.grp.getgrgid", lambda gid: MockGroup(group_names[gid])),
+            patch(f"{prefix}.os.path.isdir", lambda path: path in existing_dirs),
+            patch(f"{prefix}.shutil.disk_usage", disk_usage),
+            patch("unity_user_resources_misc.syslog.syslog"),
+        ]
+        for p in self.patches:
+            p.start()
+        self.stdout_buffer = io.StringIO()
+
+    def run_test(self, args: list[str], env: dict | None = None) -> list[str]:
+        env = {} if env is None else env
+        assert self.stdout_buffer is not None
+        with temp_env(env):
+            with patch("sys.argv", ["unity-directories-usage"] + args):
+                with contextlib.redirect_stdout(self.stdout_buffer):
+                    main()
+        output = self.stdout_buffer.getvalue().strip().splitlines()
+        self.cleanup()
+        return output
+
+    def cleanup(self):
+        self.stdout_buffer = None
+        for p in self.patches:
+            p.stop()
+
+    def assert_dirs_printed(self, stdout_lines: list[str], dirs: list[str]):
+        printed_dirs = [x.split()[0] for x in stdout_lines if x.startswith("/")]
+        self.assertEqual(dirs, printed_dirs)
+
+    # END TOOLING
+    ################################################################################################
+    # BEGIN TEST CASES
+
+    def test_all_dirs(self):
+        self.configure_test(
+            ["foo", "pi_bar", "pi_baz"], ["/project/pi_bar", "/work/pi_bar", "/project/pi_baz"]
+        )
+        stdout_lines = self.run_test([])
+        self.assert_dirs_printed(
+            stdout_lines, ["/home/foo", "/project/pi_bar", "/work/pi_bar", "/project/pi_baz"]
+        )
+        self.assertNotIn(SKIPPED_NOTE, stdout_lines)
+
+    def test_time_budget_exceeded_by_statvfs(self):
+        self.configure_test(
+            ["pi_bar", "pi_baz"],
+            ["/project/pi_bar", "/work/pi_bar", "/project/pi_baz"],
+            disk_usage_delay_seconds={"/work/pi_bar": 1},
+        )
+        stdout_lines = self.run_test(["--login"], {"UNITY_LOGIN_TIME_BUDGET_SECONDS": "0.3"})
+        self.assert_dirs_printed(stdout_lines, ["/home/foo", "/project/pi_bar"])
+        self.assertEqual(SKIPPED_NOTE, stdout_lines[-1])
+
+    def test_time_budget_ignored_without_login(self):
+        self.configure_test(
+            ["pi_bar", "pi_baz"],
+            ["/project/pi_bar", "/work/pi_bar", "/project/pi_baz"],
+            disk_usage_delay_seconds={"/work/pi_bar": 1},
+        )
+        stdout_lines = self.run_test([], {"UNITY_LOGIN_TIME_BUDGET_SECONDS": "0.3"})
+        self.assert_dirs_printed(
+            stdout_lines, ["/home/foo", "/project/pi_bar", "/work/pi_bar", "/project/pi_baz"]
+        )
+        self.assertNotIn(SKIPPED_NOTE, stdout_lines)
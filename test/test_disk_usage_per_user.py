@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+import contextlib
+import io
+import math
+import os
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+from unity_user_resources_misc.unity_disk_usage_export import (
+    DiskUsageExport,
+    DiskUsageExportWriter,
+)
+from unity_user_resources_misc.unity_disk_usage_export import main as query_main
+from unity_user_resources_misc.unity_disk_usage_per_user import (
+    AGE_HISTOGRAM_NUM_BINS,
+    UnityDiskUsagePerUser,
+    UnityDiskUsagePerUserEstimate,
+    get_age_bin,
+)
+
+"""
+see CONTRIBUTING.md for instructions on how to run tests
+"""
+
+
+def make_tree(root: str, depth: int, num_files: int, num_subdirs: int, file_size: int) -> int:
+    """
+    returns the number of inodes created, not including `root`
+    """
+    num_inodes = 0
+    for i in range(num_files):
+        with open(os.path.join(root, f"file{i}"), "wb") as f:
+            f.write(b"x" * file_size)
+        num_inodes += 1
+    if depth == 0:
+        return num_inodes
+    for i in range(num_subdirs):
+        subdir = os.path.join(root, f"dir{i}")
+        os.mkdir(subdir)
+        num_inodes += 1 + make_tree(subdir, depth - 1, num_files, num_subdirs, file_size)
+    return num_inodes
+
+
+class TestDiskUsagePerUserEstimate(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.root = self.tempdir.name
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def test_balanced_tree_is_exact(self):
+        # every probe sees the same weighted totals, so there is no variance
+        num_inodes = make_tree(self.root, depth=3, num_files=2, num_subdirs=3, file_size=10)
+        x = UnityDiskUsagePerUserEstimate(time_budget_seconds=5, seed=0)
+        x.estimate(self.root)
+        self.assertTrue(x.is_precise_enough())
+        estimates = x.get_estimates()
+        self.assertEqual([os.getuid()], list(estimates.keys()))
+        _, bytes_error, inodes_owned, inodes_error = estimates[os.getuid()]
+        self.assertEqual(0, bytes_error)
+        self.assertEqual(num_inodes, inodes_owned)
+        self.assertEqual(0, inodes_error)
+
+    def test_statvfs_scaling(self):
+        # with a single owner, the ratio estimator gives that owner every inode
+        make_tree(self.root, depth=2, num_files=1, num_subdirs=2, file_size=10)
+        extra = os.path.join(self.root, "dir0", "extra")
+        os.mkdir(extra)
+        make_tree(extra, depth=1, num_files=5, num_subdirs=4, file_size=1)
+        x = UnityDiskUsagePerUserEstimate(time_budget_seconds=1, seed=0)
+        x.total_inodes_used = 12345
+        x.estimate(self.root)
+        _, _, inodes_owned, inodes_error = x.get_estimates()[os.getuid()]
+        self.assertAlmostEqual(12345, inodes_owned)
+        self.assertAlmostEqual(0, inodes_error)
+
+    def test_unbalanced_tree_converges(self):
+        num_inodes = make_tree(self.root, depth=2, num_files=1, num_subdirs=3, file_size=10)
+        extra = os.path.join(self.root, "dir1", "extra")
+        os.mkdir(extra)
+        num_inodes += 1 + make_tree(extra, depth=1, num_files=7, num_subdirs=2, file_size=1)
+        x = UnityDiskUsagePerUserEstimate(time_budget_seconds=5, seed=0)
+        x.estimate(self.root)
+        _, _, inodes_owned, inodes_error = x.get_estimates()[os.getuid()]
+        self.assertGreater(inodes_error, 0)
+        self.assertLessEqual(abs(inodes_owned - num_inodes), inodes_error)
+
+    def test_deadline_inside_directory(self):
+        # a single probe must not run past the deadline, even in the middle of a directory
+        make_tree(self.root, depth=0, num_files=100, num_subdirs=0, file_size=1)
+        x = UnityDiskUsagePerUserEstimate(seed=0)
+        x.deadline = time.monotonic() - 1
+        self.assertIsNone(x.probe(self.root))
+        self.assertEqual({}, x.dir_cache)
+
+    def test_one_probe(self):
+        num_inodes = make_tree(self.root, depth=1, num_files=2, num_subdirs=3, file_size=10)
+        for total_inodes_used in [None, 12345]:
+            x = UnityDiskUsagePerUserEstimate(seed=0)
+            x.total_inodes_used = total_inodes_used
+            x.add_probe(x.probe(self.root))
+            _, bytes_error, inodes_owned, inodes_error = x.get_estimates()[os.getuid()]
+            self.assertEqual(total_inodes_used or num_inodes, inodes_owned)
+            self.assertEqual(math.inf, bytes_error)
+            self.assertEqual(math.inf, inodes_error)
+            stdout = io.StringIO()
+            with contextlib.redirect_stdout(stdout):
+                x.print_estimates()
+            self.assertIn("+/- unknown", stdout.getvalue())
+
+    def test_no_probes(self):
+        x = UnityDiskUsagePerUserEstimate(seed=0)
+        stdout = io.StringIO()
+        with contextlib.redirect_stdout(stdout):
+            x.print_estimates()
+        self.assertIn("no random probes finished", stdout.getvalue())
+
+
+class TestDiskUsageExport(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.root = self.tempdir.name
+        self.prefix = os.path.join(self.root, "export")
+        tree = os.path.join(self.root, "tree")
+        os.mkdir(tree)
+        make_tree(tree, depth=1, num_files=3, num_subdirs=2, file_size=10)
+        with open(os.path.join(tree, "dir1", "big"), "wb") as f:
+            f.write(b"x" * 100000)
+        old = time.time() - 1000 * 24 * 60 * 60
+        os.utime(os.path.join(tree, "dir0", "file0"), (old, old))
+        writer = DiskUsageExportWriter(self.prefix)
+        for root, dirs, files in os.walk(tree):
+            for basename in files + dirs:
+                path = os.path.join(root, basename)
+                writer.add(path, os.stat(path))
+        writer.write()
+        self.tree = tree
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def test_largest_files(self):
+        export = DiskUsageExport(self.prefix)
+        try:
+            largest = export.largest_files(os.getuid(), 2)
+            self.assertEqual(12, export.num_rows)
+            self.assertEqual((os.path.join(self.tree, "dir1", "big"), 100000), largest[0])
+            self.assertEqual([], export.largest_files(os.getuid() + 1, 2))
+        finally:
+            export.close()
+
+    def test_relative_paths(self):
+        writer = DiskUsageExportWriter(self.prefix, root=self.tree)
+        writer.add("./dir1/big", os.stat(os.path.join(self.tree, "dir1", "big")))
+        writer.write()
+        export = DiskUsageExport(self.prefix)
+        try:
+            self.assertEqual(os.path.join(self.tree, "dir1", "big"), export.path(0))
+        finally:
+            export.close()
+
+    def test_bytes_older_than(self):
+        export = DiskUsageExport(self.prefix)
+        try:
+            cutoff = int(time.time() - 180 * 24 * 60 * 60)
+            self.assertEqual({os.getuid(): 10}, export.bytes_older_than(cutoff, "mtime"))
+            self.assertEqual({os.getuid(): 10}, export.bytes_older_than(cutoff, "atime"))
+        finally:
+            export.close()
+
+    def test_empty_export(self):
+        DiskUsageExportWriter(self.prefix).write()
+        export = DiskUsageExport(self.prefix)
+        try:
+            self.assertEqual(0, export.num_rows)
+            self.assertEqual({}, export.bytes_older_than(int(time.time())))
+        finally:
+            export.close()
+
+    def run_query(self, *args: str) -> tuple[int, str, str]:
+        """
+        returns exit code, stdout, stderr
+        """
+        stdout = io.StringIO()
+        stderr = io.StringIO()
+        exit_code = 0
+        with patch("sys.argv", ["diskusage-per-user-query", self.prefix, *args]):
+            with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+                try:
+                    query_main()
+                except SystemExit as e:
+                    exit_code = e.code
+        return exit_code, stdout.getvalue(), stderr.getvalue()
+
+    def test_query_largest(self):
+        exit_code, stdout, _ = self.run_query("largest", str(os.getuid()), "-n", "1")
+        self.assertEqual(0, exit_code)
+        self.assertEqual(1, len(stdout.splitlines()))
+        self.assertIn(os.path.join(self.tree, "dir1", "big"), stdout)
+
+    def test_query_largest_unknown_user(self):
+        exit_code, stdout, stderr = self.run_query("largest", "no_such_user_hopefully")
+        self.assertEqual(1, exit_code)
+        self.assertEqual("", stdout)
+        self.assertIn("no such user", stderr)
+
+    def test_query_older_than(self):
+        # deleted users are shown by uid
+        with patch(
+            "unity_user_resources_misc.unity_disk_usage_export.pwd.getpwuid",
+            side_effect=KeyError,
+        ):
+            exit_code, stdout, _ = self.run_query("older-than", "180")
+        self.assertEqual(0, exit_code)
+        self.assertEqual([str(os.getuid()), "10", "bytes"], stdout.split())
+        exit_code, stdout, _ = self.run_query("older-than", "180", "--atime")
+        self.assertEqual(0, exit_code)
+        self.assertIn("10 bytes", stdout)
+
+
+class TestDiskUsagePerUserAgeHistograms(unittest.TestCase):
+    def test_get_age_bin(self):
+        day = 24 * 60 * 60
+        self.assertEqual(0, get_age_bin(-day))
+        self.assertEqual(0, get_age_bin(0.5 * day))
+        self.assertEqual(1, get_age_bin(1 * day))
+        self.assertEqual(1, get_age_bin(1.9 * day))
+        self.assertEqual(2, get_age_bin(2 * day))
+        self.assertEqual(8, get_age_bin(180 * day))
+        self.assertEqual(AGE_HISTOGRAM_NUM_BINS - 1, get_age_bin(100000 * day))
+
+    def test_histograms(self):
+        with tempfile.TemporaryDirectory() as root:
+            x = UnityDiskUsagePerUser(age_histograms=True, cold_days=180)
+            for name, size, mtime_days, atime_days in [
+                ("new", 10, 0, 0),
+                ("old", 100, 200, 0),
+                ("almost_cold", 10000, 179, 179),
+                ("older", 1000, 400, 400),
+            ]:
+                path = os.path.join(root, name)
+                with open(path, "wb") as f:
+                    f.write(b"x" * size)
+                day = 24 * 60 * 60
+                now = x.age_reference_time
+                os.utime(path, (now - atime_days * day, now - mtime_days * day))
+                x.add_file_to_totals(path)
+        mtime_histogram = x.uid2mtime_histogram[os.getuid()]
+        atime_histogram = x.uid2atime_histogram[os.getuid()]
+        self.assertEqual(AGE_HISTOGRAM_NUM_BINS, len(mtime_histogram))
+        self.assertEqual(10, mtime_histogram[0])
+        self.assertEqual(10100, mtime_histogram[get_age_bin(200 * day)])
+        self.assertEqual(1000, mtime_histogram[get_age_bin(400 * day)])
+        self.assertEqual(110, atime_histogram[0])
+        self.assertEqual(10000, atime_histogram[get_age_bin(179 * day)])
+        self.assertEqual(1000, atime_histogram[get_age_bin(400 * day)])
+        # exact at the threshold, even though 180 days is not a bin boundary
+        self.assertEqual([1100, 1000], list(x.uid2cold_bytes[os.getuid()]))
+        stdout = io.StringIO()
+        with contextlib.redirect_stdout(stdout):
+            x.print_age_histograms()
+        lines = stdout.getvalue().splitlines()
+        mtime_header = lines.index("bytes owned by mtime age in days:")
+        self.assertEqual(["user", "<1", "1-2"], lines[mtime_header + 1].split()[:3])
+        self.assertEqual("1024+", lines[mtime_header + 1].split()[-1])
+        # one row for the only user, after the header
+        self.assertIn("10.10 KB", lines[mtime_header + 2])
+        self.assertIn("bytes owned by atime age in days:", lines)
@@ -1,9 +1,24 @@
+import json
+import math
 import os
 import re
 import sys
+import syslog
+import threading
+import time
 from collections.abc import Sequence
 from contextlib import contextmanager
 
+# the time budget only applies when a login tool is run with `--login`.
+# login scripts should record the login start time once, and pass it to each login tool without
+# exporting it, so that they all share the same budget. Otherwise each tool gets its own budget:
+#     start="$(date +%s.%N)"
+#     UNITY_LOGIN_START_TIME="$start" unity-account-expiry-warning --login
+#     UNITY_LOGIN_START_TIME="$start" unity-directories-usage --login
+LOGIN_START_TIME_ENV_VAR = "UNITY_LOGIN_START_TIME"
+LOGIN_TIME_BUDGET_ENV_VAR = "UNITY_LOGIN_TIME_BUDGET_SECONDS"
+DEFAULT_LOGIN_TIME_BUDGET_SECONDS = 5
+
 
 def printable_length(x: str) -> int:
     assert "\n" not in x and "\t" not in x, "no newlines or tabs allowed!"
@@ -49,6 +64,13 @@ def fmt_bold(x: str):
         return x
 
 
+def fmt_dim(x: str):
+    if do_ansi():
+        return f"\033[2m{x}\033[0m"
+    else:
+        return x
+
+
 def fmt_link(url: str, text: str):
     # https://gist.github.com/egmontkob/eb114294efbcd5adb1944c9f3cb5feda
     if do_ansi():
@@ -123,3 +145,111 @@ def temp_env(env: dict):
                 del os.environ[k]
             else:
                 os.environ[k] = v
+
+
+def get_float_env(name: str, default: float) -> float:
+    """
+    a bad value must not print a traceback on the user's terminal at login
+    """
+    value = os.getenv(name, "")
+    if value == "":
+        return default
+    try:
+        output = float(value)
+    except ValueError:
+        output = math.nan
+    if not math.isfinite(output):
+        syslog.syslog(syslog.LOG_WARNING, f"ignoring invalid value for ${name}: {value!r}")
+        return default
+    return output
+
+
+class LoginTimeBudgetExceeded(TimeoutError):
+    pass
+
+
+class LoginTelemetry:
+    """
+    times each stage of a login tool and sends one JSON record per run to syslog
+    in login mode, all login tools share one wall clock budget, and once it runs out each stage is
+    abandoned so that the shell prompt is never blocked by a hung NFS mount, NSS lookup, or API call
+    outside of login mode there is no budget, so a manual run never loses its output
+    """
+
+    def __init__(self, tool: str, login=False):
+        self.tool = tool
+        self.login = login
+        if login:
+            self.start_time = get_float_env(LOGIN_START_TIME_ENV_VAR, time.time())
+            self.budget_seconds = get_float_env(
+                LOGIN_TIME_BUDGET_ENV_VAR, DEFAULT_LOGIN_TIME_BUDGET_SECONDS
+            )
+        else:
+            self.start_time = time.time()
+            self.budget_seconds = math.inf
+        self.stages = []
+
+    def remaining_seconds(self) -> float:
+        return self.start_time + self.budget_seconds - time.time()
+
+    def add_stage(self, name: str, seconds: float, status: str):
+        self.stages.append({"name": name, "seconds": round(seconds, 6), "status": status})
+
+    @contextmanager
+    def time_stage(self, name: str):
+        """
+        for stages that can't block, so they don't need to be abandoned
+        """
+        start = time.monotonic()
+        status = "error"
+        try:
+            yield
+            status = "ok"
+        finally:
+            self.add_stage(name, time.monotonic() - start, status)
+
+    def run_stage(self, name: str, func, *args, **kwargs):
+        """
+        runs `func` in a daemon thread and waits for it until the budget runs out
+        raises LoginTimeBudgetExceeded if the budget runs out first
+        """
+        if not self.login:
+            with self.time_stage(name):
+                return func(*args, **kwargs)
+        remaining_seconds = self.remaining_seconds()
+        if remaining_seconds <= 0:
+            self.add_stage(name, 0, "skipped")
+            raise LoginTimeBudgetExceeded(name)
+        result = []
+
+        def target():
+            try:
+                result.append((True, func(*args, **kwargs)))
+            except BaseException as e:
+                result.append((False, e))
+
+        start = time.monotonic()
+        thread = threading.Thread(target=target, daemon=True)
+        thread.start()
+        thread.join(remaining_seconds)
+        if len(result) == 0:
+            self.add_stage(name, time.monotonic() - start, "timeout")
+            raise LoginTimeBudgetExceeded(name)
+        succeeded, value = result[0]
+        self.add_stage(name, time.monotonic() - start, "ok" if succeeded else "error")
+        if not succeeded:
+            raise value
+        return value
+
+    def get_record(self) -> dict:
+        return {
+            "tool": self.tool,
+            "login": self.login,
+            "seconds_since_login_start": round(time.time() - self.start_time, 6),
+            "budget_seconds": self.budget_seconds if self.login else None,
+            "budget_exceeded": any(x["status"] in ["skipped", "timeout"] for x in self.stages),
+            "stages": self.stages,
+        }
+
+    def emit(self):
+        syslog.syslog(syslog.LOG_INFO, json.dumps(self.get_record()))
@@ -12,7 +12,14 @@ from http.client import HTTPResponse
 from urllib import request
 from urllib.error import HTTPError
 
-from unity_user_resources_misc import fmt_bold, fmt_link, fmt_red, fmt_table
+from unity_user_resources_misc import (
+    LoginTelemetry,
+    LoginTimeBudgetExceeded,
+    fmt_bold,
+    fmt_link,
+    fmt_red,
+    fmt_table,
+)
 
 """
 * queries the account portal's expiry API to determine when the current user is scheduled to expire
@@ -23,6 +30,9 @@ from unity_user_resources_misc import fmt_bold, fmt_link, fmt_red, fmt_table
 During the expiration process, the user is idle-locked and then later disabled.
 A warning is only printed out for the idle-lock, not for the disabling.
 Once the user is idle-locked, they cannot login so there's no point in printing a message for them.
+
+With `--login`, if the login time budget runs out, the remaining API calls are skipped and only the warnings
+collected so far are printed.
 """
 
 IDLELOCK_WARNING_THRESHOLD_DAYS = 5 * 7
@@ -98,43 +108,76 @@ def time_until(_date: str) -> timedelta:
     return date(year=year, month=month, day=day) - date.today()
 
 
-def _main():
+def get_username_and_groups() -> tuple[str, list[str], list[str]]:
     username = pwd.getpwuid(os.getuid())[0]
     ignore_users = ["root"] + grp.getgrnam("immortal").gr_mem
+    group_names = [grp.getgrgid(gidnumber)[0] for gidnumber in os.getgroups()]
+    return username, ignore_users, group_names
+
+
+def _main(telemetry: LoginTelemetry | None = None):
+    if telemetry is None:
+        telemetry = LoginTelemetry("unity-account-expiry-warning")
+    try:
+        username, ignore_users, group_names = telemetry.run_stage(
+            "group resolution", get_username_and_groups
+        )
+    except LoginTimeBudgetExceeded:
+        return
     if username in ignore_users:
         return
     pi_group_warnings = []
-    for gidnumber in os.getgroups():
-        group_name = grp.getgrgid(gidnumber)[0]
-        if not group_name.startswith("pi_"):
-            continue
-        owner_username = group_name[3:]
-        if owner_username in ignore_users or owner_username == username:
-            continue
-        owner_data = get_expiry_data(owner_username)
-        remaining = time_until(owner_data["disable_date"])
+    budget_exceeded = False
+    try:
+        for group_name in group_names:
+            if not group_name.startswith("pi_"):
+                continue
+            owner_username = group_name[3:]
+            if owner_username in ignore_users or owner_username == username:
+                continue
+            owner_data = telemetry.run_stage(
+                f"expiry API {owner_username}", get_expiry_data, owner_username
+            )
+            remaining = time_until(owner_data["disable_date"])
+            if DEBUG:
+                print(f"time until PI group '{group_name} is disabled: {remaining}")
+            if remaining.days <= PI_GROUP_OWNER_DISABLE_WARNING_THRESHOLD_DAYS:
+                pi_group_warnings.append((group_name, owner_username, remaining))
+    except LoginTimeBudgetExceeded:
+        budget_exceeded = True
+    with telemetry.time_stage("rendering PI group owner warnings"):
+        print_pi_group_owner_disable_warning(pi_group_warnings)
+    if budget_exceeded:
+        return
+    try:
+        data = telemetry.run_stage(f"expiry API {username}", get_expiry_data, username)
+    except LoginTimeBudgetExceeded:
+        return
+    with telemetry.time_stage("rendering idle-lock warning"):
+        time_until_idlelock = time_until(data["idlelock_date"])
         if DEBUG:
-            print(f"time until PI group '{group_name} is disabled: {remaining}")
-        if remaining.days <= PI_GROUP_OWNER_DISABLE_WARNING_THRESHOLD_DAYS:
-            pi_group_warnings.append((group_name, owner_username, remaining))
-    print_pi_group_owner_disable_warning(pi_group_warnings)
-    data = get_expiry_data(username)
-    time_until_idlelock = time_until(data["idlelock_date"])
-    if DEBUG:
-        print(f"{time_until_idlelock=}")
-    if time_until_idlelock.days <= IDLELOCK_WARNING_THRESHOLD_DAYS:
-        print_idlelock_warning(time_until_idlelock)
+            print(f"{time_until_idlelock=}")
+        if time_until_idlelock.days <= IDLELOCK_WARNING_THRESHOLD_DAYS:
+            print_idlelock_warning(time_until_idlelock)
 
 
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("-v", "--verbose", action="store_true")
+    parser.add_argument(
+        "--login", action="store_true", help="give up on slow API calls after the time budget"
+    )
     args = parser.parse_args()
+    telemetry = LoginTelemetry("unity-account-expiry-warning", login=args.login)
     try:
-        _main()
+        _main(telemetry)
     except Exception:
         if args.verbose:
             raise
         else:
             syslog.syslog(syslog.LOG_ERR, traceback.format_exc())
             sys.exit(1)
+    finally:
+        if args.verbose:
+            print(json.dumps(telemetry.get_record(), indent=4), file=sys.stderr)
+        telemetry.emit()
@@ -1,35 +1,55 @@
+import argparse
 import grp
 import os
 import shutil
 
-from unity_user_resources_misc import fmt_red, fmt_table, human_readable_size
+from unity_user_resources_misc import (
+    LoginTelemetry,
+    LoginTimeBudgetExceeded,
+    fmt_dim,
+    fmt_red,
+    fmt_table,
+    human_readable_size,
+)
 
 """
 basically a wrapper around `df`
+with `--login`, if the login time budget runs out, prints whatever usage has been collected so far
 """
 
 USAGE_PERCENT_RED_THRESHOLD = 75
 
 
-def main():
+def get_pi_group_names() -> list[str]:
+    gr_names = [grp.getgrgid(gid).gr_name for gid in os.getgroups()]
+    return [x for x in gr_names if x.startswith("pi_")]
+
+
+def _main(telemetry: LoginTelemetry):
     usage = []
 
     # if timed out, print whatever usage has been collected so far
-    # this was removed since bad NFS requires sigkill
+    # signal handlers were removed since bad NFS requires sigkill, so instead each blocking call
+    # is abandoned in a daemon thread once the login time budget runs out
     # signal.signal(signal.SIGTERM, lambda foo, bar: print_usage_and_exit())
 
+    budget_exceeded = False
     dirs_to_check = [os.path.expanduser("~")]  # home directory
-    for gid in os.getgroups():
-        gr_name = grp.getgrgid(gid).gr_name
-        if not gr_name.startswith("pi_"):
-            continue
-        for prefix in "/project", "/work":
-            dir_path = os.path.join(prefix, gr_name)
-            if os.path.isdir(dir_path):
-                dirs_to_check.append(dir_path)
+    try:
+        for gr_name in telemetry.run_stage("group resolution", get_pi_group_names):
+            for prefix in "/project", "/work":
+                dir_path = os.path.join(prefix, gr_name)
+                if telemetry.run_stage(f"isdir {dir_path}", os.path.isdir, dir_path):
+                    dirs_to_check.append(dir_path)
+    except LoginTimeBudgetExceeded:
+        budget_exceeded = True
 
     for dir_path in dirs_to_check:
-        total, used, _ = shutil.disk_usage(dir_path)
+        try:
+            total, used, _ = telemetry.run_stage(f"statvfs {dir_path}", shutil.disk_usage, dir_path)
+        except LoginTimeBudgetExceeded:
+            budget_exceeded = True
+            break
         pcent_used = (used / total) * 100
         if pcent_used >= USAGE_PERCENT_RED_THRESHOLD:
             usage.append(
@@ -53,6 +73,22 @@ def main():
                     f"{(pcent_used):.0f}%",
                 ]
             )
-    if usage != []:
-        for line in fmt_table(usage):
-            print(line)
+    with telemetry.time_stage("rendering"):
+        if usage != []:
+            for line in fmt_table(usage):
+                print(line)
+        if budget_exceeded:
+            print(fmt_dim("some directories were skipped because the login time budget ran out"))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--login", action="store_true", help="give up on slow filesystems after the time budget"
+    )
+    args = parser.parse_args()
+    telemetry = LoginTelemetry("unity-directories-usage", login=args.login)
+    try:
+        _main(telemetry)
+    finally:
+        telemetry.emit()
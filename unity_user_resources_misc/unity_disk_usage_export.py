@@ -0,0 +1,196 @@
+import argparse
+import heapq
+import mmap
+import os
+import pwd
+import struct
+import sys
+import time
+from array import array
+from itertools import compress, repeat
+from operator import eq
+
+from unity_user_resources_misc import fmt_table, human_readable_size
+
+"""
+columnar per-file metadata exported by `diskusage-per-user --export PREFIX`, and a command to
+query it without touching the filesystem again.
+
+PREFIX.columns: header followed by one fixed-width array per column, in native byte order
+PREFIX.dirs: NUL separated absolute directory paths, where the index of each path is its dir_id
+PREFIX.names: NUL terminated basenames, where each row's name_offset is the start of its name
+
+the columns and names files are memory-mapped, so queries only page in what they scan.
+I would use numpy but I don't want nonstandard imports
+"""
+
+EXPORT_MAGIC = b"UDUPUCOL"
+EXPORT_HEADER = struct.Struct("=8sQ")  # magic, number of rows
+EXPORT_COLUMNS = [
+    ("uid", "I"),
+    ("size", "q"),
+    ("blocks", "q"),
+    ("mtime", "q"),
+    ("atime", "q"),
+    ("dir_id", "I"),
+    ("name_offset", "Q"),
+]
+EXPORT_ALIGNMENT = 8
+SECONDS_PER_DAY = 24 * 60 * 60
+
+
+def _padding(length: int) -> int:
+    return -length % EXPORT_ALIGNMENT
+
+
+class DiskUsageExportWriter:
+    """
+    not thread safe, the caller must hold a lock
+    """
+
+    def __init__(self, prefix: str, root: str | None = None):
+        """
+        relative paths given to `add` are relative to `root`, which defaults to the cwd
+        """
+        self.prefix = prefix
+        self.root = os.path.realpath(os.getcwd()) if root is None else root
+        self.columns = {name: array(typecode) for name, typecode in EXPORT_COLUMNS}
+        self.dir2id = {}
+        self.names = bytearray()
+
+    def add(self, path: str, stat: os.stat_result):
+        dirname, basename = os.path.split(path)
+        dir_id = self.dir2id.setdefault(dirname, len(self.dir2id))
+        self.columns["uid"].append(stat.st_uid)
+        self.columns["size"].append(stat.st_size)
+        self.columns["blocks"].append(stat.st_blocks)
+        self.columns["mtime"].append(int(stat.st_mtime))
+        self.columns["atime"].append(int(stat.st_atime))
+        self.columns["dir_id"].append(dir_id)
+        self.columns["name_offset"].append(len(self.names))
+        self.names += os.fsencode(basename) + b"\0"
+
+    def write(self):
+        num_rows = len(self.columns["uid"])
+        with open(f"{self.prefix}.columns", "wb") as f:
+            f.write(EXPORT_HEADER.pack(EXPORT_MAGIC, num_rows))
+            f.write(b"\0" * _padding(EXPORT_HEADER.size))
+            for name, _ in EXPORT_COLUMNS:
+                column = self.columns[name]
+                column.tofile(f)
+                f.write(b"\0" * _padding(column.itemsize * num_rows))
+        with open(f"{self.prefix}.dirs", "wb") as f:
+            f.write(
+                b"\0".join(
+                    os.fsencode(os.path.normpath(os.path.join(self.root, x)))
+                    for x in self.dir2id.keys()
+                )
+            )
+        with open(f"{self.prefix}.names", "wb") as f:
+            f.write(self.names)
+
+
+class DiskUsageExport:
+    def __init__(self, prefix: str):
+        with open(f"{prefix}.columns", "rb") as f:
+            self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.num_rows = EXPORT_HEADER.unpack_from(self.mmap)
+        if magic != EXPORT_MAGIC:
+            raise ValueError(f"{prefix}.columns is not a diskusage-per-user export")
+        self.columns = {}
+        offset = EXPORT_HEADER.size + _padding(EXPORT_HEADER.size)
+        view = memoryview(self.mmap)
+        for name, typecode in EXPORT_COLUMNS:
+            length = struct.calcsize(typecode) * self.num_rows
+            self.columns[name] = view[offset : offset + length].cast(typecode)
+            offset += length + _padding(length)
+        view.release()
+        with open(f"{prefix}.dirs", "rb") as f:
+            self.dirs = [os.fsdecode(x) for x in f.read().split(b"\0")]
+        with open(f"{prefix}.names", "rb") as f:
+            # mmap does not allow empty files
+            if os.fstat(f.fileno()).st_size == 0:
+                self.names = b""
+            else:
+                self.names = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def close(self):
+        for column in self.columns.values():
+            column.release()
+        self.mmap.close()
+        if isinstance(self.names, mmap.mmap):
+            self.names.close()
+
+    def path(self, row: int) -> str:
+        name_offset = self.columns["name_offset"][row]
+        name = self.names[name_offset : self.names.find(b"\0", name_offset)]
+        return os.path.join(self.dirs[self.columns["dir_id"][row]], os.fsdecode(name))
+
+    def largest_files(self, uid: int, n: int) -> list[tuple[str, int]]:
+        sizes = self.columns["size"]
+        rows = compress(range(self.num_rows), map(eq, self.columns["uid"], repeat(uid)))
+        return [(self.path(x), sizes[x]) for x in heapq.nlargest(n, rows, key=sizes.__getitem__)]
+
+    def bytes_older_than(self, cutoff_timestamp: int, time_column="mtime") -> dict[int, int]:
+        uid2bytes = {}
+        is_older = map(cutoff_timestamp.__gt__, self.columns[time_column])
+        for uid, size in compress(zip(self.columns["uid"], self.columns["size"]), is_older):
+            uid2bytes[uid] = uid2bytes.get(uid, 0) + size
+        return uid2bytes
+
+
+def user2uid(user: str) -> int:
+    if user.isdigit():
+        return int(user)
+    return pwd.getpwnam(user).pw_uid
+
+
+def uid2username(uid: int) -> str:
+    try:
+        return pwd.getpwuid(uid).pw_name
+    except KeyError:  # deleted user
+        return str(uid)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="query the output of `diskusage-per-user --export PREFIX`"
+    )
+    parser.add_argument("prefix")
+    subparsers = parser.add_subparsers(dest="query", required=True)
+    largest_parser = subparsers.add_parser("largest", help="largest files owned by a user")
+    largest_parser.add_argument("user", help="username or uid")
+    largest_parser.add_argument("-n", type=int, default=20)
+    older_parser = subparsers.add_parser("older-than", help="bytes older than DAYS per user")
+    older_parser.add_argument("days", type=float)
+    older_parser.add_argument("--atime", action="store_true", help="use atime instead of mtime")
+    args = parser.parse_args()
+    try:
+        export = DiskUsageExport(args.prefix)
+    except (OSError, ValueError) as e:
+        print(e, file=sys.stderr)
+        sys.exit(1)
+    try:
+        if args.query == "largest":
+            try:
+                uid = user2uid(args.user)
+            except KeyError:
+                print(f"no such user: '{args.user}'", file=sys.stderr)
+                sys.exit(1)
+            table = [
+                [human_readable_size(size), path]
+                for path, size in export.largest_files(uid, args.n)
+            ]
+        else:
+            cutoff_timestamp = int(time.time() - args.days * SECONDS_PER_DAY)
+            time_column = "atime" if args.atime else "mtime"
+            uid2bytes = export.bytes_older_than(cutoff_timestamp, time_column)
+            table = [
+                [uid2username(uid), human_readable_size(bytes_owned)]
+                for uid, bytes_owned in sorted(uid2bytes.items(), key=lambda x: x[1], reverse=True)
+            ]
+    finally:
+        export.close()
+    if table != []:
+        for line in fmt_table(table):
+            print(line)
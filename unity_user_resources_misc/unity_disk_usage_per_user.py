@@ -1,9 +1,13 @@
 # in theory 99% of the time spent in IO wait so it doesn't matter that python is a slow language?
 # edit: it does matter. this is twice as slow as `du`.
+import argparse
 import itertools
+import math
 import os
 import pwd
+import random
 import sys
+from array import array
 
 # import signal
 # import atexit
@@ -11,16 +15,31 @@ import threading
 import time
 from concurrent.futures import ThreadPoolExecutor
 from functools import lru_cache
+from stat import S_ISDIR
 
 from unity_user_resources_misc import fmt_table, human_readable_count, human_readable_size
+from unity_user_resources_misc.unity_disk_usage_export import DiskUsageExportWriter
 
 """
 multithreaded `du` command that displays the total bytes owned by ecah user
 if possible, uses `statvfs` to determine the total number inodes in the directory,
 and displays a progress bar based on the number of inodes processed at a given time
+with `--estimate`, samples random paths through the directory tree instead of scanning everything
+with `--export`, saves per-file metadata for `diskusage-per-user-query`
+with `--age-histograms`, also reports the bytes owned by each user in log-spaced mtime/atime bins,
+and the bytes owned by each user that are older than `--cold-days`
 """
 
 NUM_THREADS = 4
+ESTIMATE_Z_SCORE = 1.96  # 95% confidence
+ESTIMATE_MIN_PROBES = 30
+ESTIMATE_MIN_SHARE = 0.01  # users owning less than this are not considered when checking precision
+ESTIMATE_DEFAULT_TIME_BUDGET_SECONDS = 10
+ESTIMATE_DEFAULT_TARGET_RELATIVE_ERROR = 0.05
+# bin 0 is < 1 day old, bin i is [2^(i-1), 2^i) days old, and the last bin has no upper bound
+AGE_HISTOGRAM_NUM_BINS = 12
+AGE_HISTOGRAM_DEFAULT_COLD_DAYS = 180
+SECONDS_PER_DAY = 24 * 60 * 60
 
 
 @lru_cache(maxsize=None)
@@ -40,6 +59,28 @@ def get_total_inodes_used_statvfs(path) -> int | None:
     return cwd_statvfs.f_files - cwd_statvfs.f_ffree
 
 
+def fmt_error(error: float, fmt_func) -> str:
+    if not math.isfinite(error):
+        return "+/- unknown"
+    return f"+/- {fmt_func(round(error))}"
+
+
+def get_age_bin(age_seconds: float) -> int:
+    age_days = age_seconds / SECONDS_PER_DAY
+    if age_days < 1:
+        return 0
+    # for x >= 1, frexp(x)[1] == floor(log2(x)) + 1
+    return min(math.frexp(age_days)[1], AGE_HISTOGRAM_NUM_BINS - 1)
+
+
+def get_age_bin_label(age_bin: int) -> str:
+    if age_bin == 0:
+        return "<1"
+    if age_bin == AGE_HISTOGRAM_NUM_BINS - 1:
+        return f"{2 ** (age_bin - 1)}+"
+    return f"{2 ** (age_bin - 1)}-{2 ** age_bin}"
+
+
 # def enable_alternate_screen_mode():
 #     print("\033[?1049h\033[H")
 
@@ -52,7 +93,12 @@ def get_total_inodes_used_statvfs(path) -> int | None:
 
 
 class UnityDiskUsagePerUser:
-    def __init__(self):
+    def __init__(
+        self,
+        export_prefix: str | None = None,
+        age_histograms=False,
+        cold_days=AGE_HISTOGRAM_DEFAULT_COLD_DAYS,
+    ):
         self.counting_lock = threading.Lock()
         self.done_counting = threading.Event()
         self.uid2bytes_owned = {}
@@ -60,9 +106,23 @@ class UnityDiskUsagePerUser:
         self.total_inodes_counted = 0
         self.total_inodes_used = None
         self.total_bytes_used = 0
+        self.export_writer = None if export_prefix is None else DiskUsageExportWriter(export_prefix)
+        self.age_histograms = age_histograms
+        self.age_reference_time = time.time()
+        # uid -> bytes owned in each age bin
+        self.uid2mtime_histogram = {}
+        self.uid2atime_histogram = {}
+        # the histogram bins don't line up with arbitrary thresholds, so cold data is also
+        # counted exactly. uid -> [bytes with mtime older than cold_days, same for atime]
+        self.cold_days = cold_days
+        self.cold_cutoff_time = self.age_reference_time - cold_days * SECONDS_PER_DAY
+        self.uid2cold_bytes = {}
 
     def add_file_to_totals(self, path: str):
         stat = os.stat(path)
+        if self.age_histograms:
+            mtime_bin = get_age_bin(self.age_reference_time - stat.st_mtime)
+            atime_bin = get_age_bin(self.age_reference_time - stat.st_atime)
         with self.counting_lock:
             self.uid2bytes_owned[stat.st_uid] = (
                 self.uid2bytes_owned.get(stat.st_uid, 0) + stat.st_size
@@ -70,6 +130,26 @@ class UnityDiskUsagePerUser:
             self.uid2paths_and_sizes.setdefault(stat.st_uid, []).append([path, stat.st_size])
             self.total_inodes_counted += 1
             self.total_bytes_used += stat.st_size
+            if self.export_writer is not None:
+                self.export_writer.add(path, stat)
+            if self.age_histograms:
+                for uid2histogram, age_bin in [
+                    (self.uid2mtime_histogram, mtime_bin),
+                    (self.uid2atime_histogram, atime_bin),
+                ]:
+                    histogram = uid2histogram.get(stat.st_uid)
+                    if histogram is None:
+                        histogram = array("q", [0] * AGE_HISTOGRAM_NUM_BINS)
+                        uid2histogram[stat.st_uid] = histogram
+                    histogram[age_bin] += stat.st_size
+                cold_bytes = self.uid2cold_bytes.get(stat.st_uid)
+                if cold_bytes is None:
+                    cold_bytes = array("q", [0, 0])
+                    self.uid2cold_bytes[stat.st_uid] = cold_bytes
+                if stat.st_mtime < self.cold_cutoff_time:
+                    cold_bytes[0] += stat.st_size
+                if stat.st_atime < self.cold_cutoff_time:
+                    cold_bytes[1] += stat.st_size
 
     def print_current_totals(self):
         if self.total_inodes_used is None:
@@ -94,6 +174,40 @@ class UnityDiskUsagePerUser:
             print(line)
         print()
 
+    def print_age_histograms(self):
+        sorted_uids = [
+            uid for uid, _ in sorted(self.uid2bytes_owned.items(), key=lambda x: x[1], reverse=True)
+        ]
+        for time_name, uid2histogram in [
+            ("mtime", self.uid2mtime_histogram),
+            ("atime", self.uid2atime_histogram),
+        ]:
+            print(f"bytes owned by {time_name} age in days:")
+            usage_table = [["user"] + [get_age_bin_label(x) for x in range(AGE_HISTOGRAM_NUM_BINS)]]
+            for uid in sorted_uids:
+                usage_table.append(
+                    [uid2username(uid)] + [human_readable_size(x) for x in uid2histogram[uid]]
+                )
+            for line in fmt_table(usage_table):
+                print(line)
+            print()
+
+    def print_cold_totals(self):
+        cold_days = f"{self.cold_days:g}"
+        usage_table = [
+            ["user", "total", f"mtime > {cold_days} days", "", f"atime > {cold_days} days", ""]
+        ]
+        for uid, bytes_owned in sorted(
+            self.uid2bytes_owned.items(), key=lambda x: x[1], reverse=True
+        ):
+            row = [uid2username(uid), human_readable_size(bytes_owned)]
+            for cold_bytes in self.uid2cold_bytes[uid]:
+                pcent = (cold_bytes / bytes_owned) * 100 if bytes_owned > 0 else 0
+                row += [human_readable_size(cold_bytes), f"{pcent:.1f}%"]
+            usage_table.append(row)
+        for line in fmt_table(usage_table):
+            print(line)
+
     def loop_print_current_totals(self, sleep_seconds=1):
         while not self.done_counting.is_set():
             self.print_current_totals()
@@ -121,10 +235,281 @@ class UnityDiskUsagePerUser:
             )
             executor.map(self.add_file_to_totals, walk_path_gen)
         self.print_current_totals()
+        if self.age_histograms:
+            self.print_age_histograms()
+            self.print_cold_totals()
+        if self.export_writer is not None:
+            self.export_writer.write()
         # self.done_counting.set()
         # print_current_totals_thread.join()
 
 
+class UnityDiskUsagePerUserEstimate:
+    """
+    estimates the bytes and inodes owned by each user without scanning the whole directory.
+    each probe is a random descent from the root to a leaf directory. every inode found along the
+    way is weighted by the product of the number of subdirectories at each level above it, so each
+    probe is an unbiased estimate of the totals (Knuth's estimator), and the average of many probes
+    converges to the true totals.
+    if possible, the estimates are scaled so that the total inode count matches `statvfs`
+    (ratio estimator), which greatly reduces the variance.
+    """
+
+    def __init__(
+        self,
+        time_budget_seconds=ESTIMATE_DEFAULT_TIME_BUDGET_SECONDS,
+        target_relative_error=ESTIMATE_DEFAULT_TARGET_RELATIVE_ERROR,
+        seed=None,
+    ):
+        self.time_budget_seconds = time_budget_seconds
+        self.target_relative_error = target_relative_error
+        self.random = random.Random(seed)
+        # path -> (uid -> [bytes, inodes], subdirectory paths)
+        self.dir_cache = {}
+        self.num_probes = 0
+        # sums over probes of the estimated total inodes, and of its square
+        self.sum_inodes = 0
+        self.sum_inodes_squared = 0
+        # uid -> [sum bytes, sum bytes^2, sum bytes*total inodes, sum inodes, sum inodes^2, ...]
+        self.uid2sums = {}
+        self.total_inodes_used = None
+        self.deadline = math.inf  # time.monotonic() value
+
+    def scan_directory(self, path: str) -> tuple[dict, list] | None:
+        """
+        returns None if the deadline passes before the directory is fully scanned
+        one huge directory can take much longer than the time budget to scan
+        """
+        if path in self.dir_cache:
+            return self.dir_cache[path]
+        uid2usage = {}
+        subdirs = []
+        try:
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    if time.monotonic() >= self.deadline:
+                        return None
+                    try:
+                        stat = entry.stat(follow_symlinks=False)
+                    except OSError:
+                        continue
+                    if S_ISDIR(stat.st_mode):
+                        subdirs.append(entry.path)
+                    usage = uid2usage.setdefault(stat.st_uid, [0, 0])
+                    usage[0] += stat.st_size
+                    usage[1] += 1
+        except OSError:
+            pass  # unreadable directories are treated as empty
+        self.dir_cache[path] = (uid2usage, subdirs)
+        return uid2usage, subdirs
+
+    def probe(self, root=".") -> dict | None:
+        """
+        returns None if the deadline passes before the probe is finished
+        """
+        uid2usage = {}
+        path = root
+        weight = 1
+        while True:
+            scan_result = self.scan_directory(path)
+            if scan_result is None:
+                return None
+            dir_uid2usage, subdirs = scan_result
+            for uid, (bytes_owned, inodes_owned) in dir_uid2usage.items():
+                usage = uid2usage.setdefault(uid, [0, 0])
+                usage[0] += weight * bytes_owned
+                usage[1] += weight * inodes_owned
+            if len(subdirs) == 0:
+                return uid2usage
+            weight *= len(subdirs)
+            path = self.random.choice(subdirs)
+
+    def add_probe(self, uid2usage: dict):
+        total_inodes = sum(inodes for _, inodes in uid2usage.values())
+        self.num_probes += 1
+        self.sum_inodes += total_inodes
+        self.sum_inodes_squared += total_inodes**2
+        for uid, (bytes_owned, inodes_owned) in uid2usage.items():
+            sums = self.uid2sums.setdefault(uid, [0] * 6)
+            for i, value in enumerate([bytes_owned, inodes_owned]):
+                sums[3 * i] += value
+                sums[3 * i + 1] += value**2
+                sums[3 * i + 2] += value * total_inodes
+
+    def _estimate(self, sum_y, sum_y_squared, sum_y_times_inodes) -> tuple[float, float]:
+        """
+        returns the estimate and the half-width of its confidence interval
+        with fewer than 2 probes the variance is unknown, so the half-width is infinite
+        """
+        n = self.num_probes
+        if self.total_inodes_used is None or self.sum_inodes == 0:
+            mean = sum_y / n
+            if n < 2:
+                return mean, math.inf
+            variance = max(sum_y_squared / n - mean**2, 0) * n / (n - 1)
+            return mean, ESTIMATE_Z_SCORE * math.sqrt(variance / n)
+        ratio = sum_y / self.sum_inodes
+        if n < 2:
+            return ratio * self.total_inodes_used, math.inf
+        residual_sum_squares = (
+            sum_y_squared - 2 * ratio * sum_y_times_inodes + ratio**2 * self.sum_inodes_squared
+        )
+        variance = max(residual_sum_squares, 0) / (n - 1)
+        mean_inodes = self.sum_inodes / n
+        scale = self.total_inodes_used / mean_inodes
+        return ratio * self.total_inodes_used, ESTIMATE_Z_SCORE * scale * math.sqrt(variance / n)
+
+    def get_estimates(self) -> dict:
+        """
+        returns uid -> (bytes, bytes interval half-width, inodes, inodes interval half-width)
+        """
+        output = {}
+        for uid, sums in self.uid2sums.items():
+            bytes_owned, bytes_error = self._estimate(*sums[0:3])
+            inodes_owned, inodes_error = self._estimate(*sums[3:6])
+            output[uid] = (bytes_owned, bytes_error, inodes_owned, inodes_error)
+        return output
+
+    def is_precise_enough(self) -> bool:
+        if self.num_probes < ESTIMATE_MIN_PROBES:
+            return False
+        estimates = self.get_estimates()
+        total_bytes = sum(x[0] for x in estimates.values())
+        total_inodes = sum(x[2] for x in estimates.values())
+        for bytes_owned, bytes_error, inodes_owned, inodes_error in estimates.values():
+            if bytes_owned >= ESTIMATE_MIN_SHARE * total_bytes:
+                if bytes_error > self.target_relative_error * bytes_owned:
+                    return False
+            if inodes_owned >= ESTIMATE_MIN_SHARE * total_inodes:
+                if inodes_error > self.target_relative_error * inodes_owned:
+                    return False
+        return True
+
+    def estimate(self, root="."):
+        self.deadline = time.monotonic() + self.time_budget_seconds
+        while True:
+            uid2usage = self.probe(root)
+            if uid2usage is None:
+                break
+            self.add_probe(uid2usage)
+            if self.num_probes % ESTIMATE_MIN_PROBES == 0 and self.is_precise_enough():
+                break
+
+    def print_estimates(self):
+        if self.num_probes == 0:
+            print("no random probes finished within the time budget, so there is no estimate.")
+            return
+        if self.num_probes < 2:
+            print(
+                "only one random probe finished within the time budget,"
+                " so the confidence intervals are unknown."
+            )
+        print(
+            f"estimated from {self.num_probes} random probes"
+            f" ({len(self.dir_cache)} directories scanned)"
+            f" with {ESTIMATE_Z_SCORE} standard error confidence intervals"
+        )
+        estimates = self.get_estimates()
+        total_bytes = sum(x[0] for x in estimates.values())
+        if total_bytes == 0:
+            return
+        usage_table = []
+        for uid, (bytes_owned, bytes_error, inodes_owned, inodes_error) in sorted(
+            estimates.items(), key=lambda x: x[1][0], reverse=True
+        ):
+            pcent = (bytes_owned / total_bytes) * 100
+            usage_table.append(
+                [
+                    uid2username(uid),
+                    human_readable_size(round(bytes_owned)),
+                    fmt_error(bytes_error, human_readable_size),
+                    f"{pcent:.1f}%",
+                    f"{human_readable_count(round(inodes_owned))} inodes",
+                    fmt_error(inodes_error, human_readable_count),
+                ]
+            )
+        for line in fmt_table(usage_table):
+            print(line)
+
+    def main(self):
+        self.total_inodes_used = get_total_inodes_used_statvfs(os.path.realpath(os.getcwd()))
+        if self.total_inodes_used == None:
+            print(
+                "this directory does not have a unique statvfs, so estimates cannot be scaled.",
+                file=sys.stderr,
+            )
+        self.estimate()
+        self.print_estimates()
+
+
 def main():
-    x = UnityDiskUsagePerUser()
-    x.main()
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--estimate",
+        action="store_true",
+        help="sample random paths through the directory tree rather than scanning everything",
+    )
+    parser.add_argument(
+        "--time-budget",
+        type=float,
+        help=(
+            "with --estimate, give up on the target error after this many seconds"
+            f" (default: {ESTIMATE_DEFAULT_TIME_BUDGET_SECONDS})"
+        ),
+    )
+    parser.add_argument(
+        "--target-error",
+        type=float,
+        help=(
+            "with --estimate, stop once every confidence interval is within this fraction"
+            f" (default: {ESTIMATE_DEFAULT_TARGET_RELATIVE_ERROR})"
+        ),
+    )
+    parser.add_argument(
+        "--export",
+        metavar="PREFIX",
+        help="save per-file metadata to PREFIX.{columns,dirs,names} for diskusage-per-user-query",
+    )
+    parser.add_argument(
+        "--age-histograms",
+        action="store_true",
+        help="also report each user's bytes by mtime/atime age, and how much of it is cold",
+    )
+    parser.add_argument(
+        "--cold-days",
+        type=float,
+        help=(
+            "with --age-histograms, data older than this many days is cold"
+            f" (default: {AGE_HISTOGRAM_DEFAULT_COLD_DAYS})"
+        ),
+    )
+    args = parser.parse_args()
+    if args.estimate and args.export is not None:
+        parser.error("--export cannot be used with --estimate")
+    if args.estimate and args.age_histograms:
+        parser.error("--age-histograms cannot be used with --estimate")
+    if not args.estimate and args.time_budget is not None:
+        parser.error("--time-budget can only be used with --estimate")
+    if not args.estimate and args.target_error is not None:
+        parser.error("--target-error can only be used with --estimate")
+    if not args.age_histograms and args.cold_days is not None:
+        parser.error("--cold-days can only be used with --age-histograms")
+    if args.cold_days is not None and args.cold_days < 0:
+        parser.error("--cold-days cannot be negative")
+    if args.estimate:
+        estimate_kwargs = {}
+        if args.time_budget is not None:
+            estimate_kwargs["time_budget_seconds"] = args.time_budget
+        if args.target_error is not None:
+            estimate_kwargs["target_relative_error"] = args.target_error
+        x = UnityDiskUsagePerUserEstimate(**estimate_kwargs)
+        x.main()
+    else:
+        x = UnityDiskUsagePerUser(
+            export_prefix=args.export,
+            age_histograms=args.age_histograms,
+            cold_days=(
+                AGE_HISTOGRAM_DEFAULT_COLD_DAYS if args.cold_days is None else args.cold_days
+            ),
+        )
+        x.main()